@@ -4,11 +4,23 @@ Flask web application for generating PDFs from images with priority-based sortin
 """
 
 import os
+import re
+import logging
+import json
+import queue
+import time
+import uuid
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 import zipfile
 from pathlib import Path
-from flask import Flask, render_template, request, send_file, flash, jsonify
+from typing import Dict, List, Optional
+from flask import (Flask, Request, Response, after_this_request, render_template, request,
+                   send_file, flash, jsonify, url_for)
 from werkzeug.utils import secure_filename
+from streaming_form_data import StreamingFormDataParser
+from streaming_form_data.parser import ParseFailedException
+from streaming_form_data.targets import BaseTarget, ValueTarget
 import shutil
 
 # Import functions from the original script
@@ -20,17 +32,96 @@ from image_to_pdf_core import (
 )
 from reportlab.lib.pagesizes import letter, A4
 
+logging.basicConfig(level=logging.INFO)
+
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max upload
 app.config['UPLOAD_FOLDER'] = tempfile.gettempdir()
+# Let a reverse proxy send finished PDFs from disk: X-Sendfile (Apache,
+# lighttpd) or an nginx internal location prefix for X-Accel-Redirect
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
+app.config['X_ACCEL_REDIRECT_PREFIX'] = os.environ.get('X_ACCEL_REDIRECT_PREFIX', '')
+
+ALLOWED_EXTENSIONS = frozenset({'.png', '.jpg', '.jpeg'})
+UPLOAD_CHUNK_SIZE = 64 * 1024  # Bytes read from the request stream per parser call
+UPLOAD_BUFFER_SIZE = 1 << 20  # Write buffer for each uploaded image file
+
+HEARTBEAT_INTERVAL = 15  # Seconds between SSE keep-alive comments
+PROGRESS_TIMEOUT = 120  # Seconds without progress before a stream gives up
+MAX_CONCURRENT_JOBS = 2  # PDF builds run at once; later uploads wait their turn
+JOB_ID_RE = re.compile(r'[0-9a-f]{32}')
+JOB_MAX_AGE = 60 * 60  # Seconds before an untouched job directory is swept
+
+# Progress queues of PDF jobs, keyed by job id, and when each job finished
+JOBS: Dict[str, queue.Queue] = {}
+FINISHED_JOBS: Dict[str, float] = {}
+
+# Runs PDF builds; each build already uses a thread pool of its own, so
+# this only bounds how many builds (and their memory) are live at once
+PDF_BUILDS = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS, thread_name_prefix='pdf_build')
+
+
+class StreamRequest(Request):
+    """
+    Request that spools every file part werkzeug parses straight to disk.
+    
+    /generate-pdf streams its body itself, but any request.files access
+    elsewhere would otherwise keep parts up to 500KB in memory.
+    """
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        return tempfile.NamedTemporaryFile(dir=app.config['UPLOAD_FOLDER'], suffix='.upload',
+                                           buffering=UPLOAD_BUFFER_SIZE)
+
 
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+app.request_class = StreamRequest
 
 
 def allowed_file(filename):
     """Check if file has an allowed extension."""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return os.path.splitext(filename)[1].lower() in ALLOWED_EXTENSIONS
+
+
+class ImageDirectoryTarget(BaseTarget):
+    """
+    Streaming target that writes each uploaded image straight to a directory.
+
+    Every part registered under the same field name (e.g. repeated 'images')
+    is written to its own file as the bytes arrive, so uploads never have to
+    be held in memory. Parts with a disallowed extension are discarded.
+    """
+
+    def __init__(self, directory: Path):
+        super().__init__()
+        self.directory = directory
+        self.paths = []
+        self._fd = None
+
+    def on_start(self):
+        filename = self.multipart_filename or ''
+        if not allowed_file(filename):
+            self._fd = None
+            return
+        file_path = self.directory / secure_filename(filename)
+        self._fd = open(file_path, 'wb', buffering=UPLOAD_BUFFER_SIZE)
+        self.paths.append(file_path)
+
+    def on_data_received(self, chunk: bytes):
+        if self._fd is not None:
+            self._fd.write(chunk)
+
+    def on_finish(self):
+        self.close()
+
+    def close(self) -> bool:
+        """Close the file of an unfinished part, returning True if there was one."""
+        if self._fd is None:
+            return False
+        self._fd.close()
+        self._fd = None
+        return True
 
 
 @app.route('/')
@@ -39,76 +130,214 @@ def index():
     return render_template('index.html')
 
 
+def job_dir(job_id: str) -> Optional[Path]:
+    """Return the working directory for a job, or None for a malformed id."""
+    if not JOB_ID_RE.fullmatch(job_id):
+        return None
+    return Path(app.config['UPLOAD_FOLDER']) / f'pdf_gen_{job_id}'
+
+
+def forget_job(job_id: str):
+    """Drop a job's progress queue and finish time."""
+    JOBS.pop(job_id, None)
+    FINISHED_JOBS.pop(job_id, None)
+
+
+def prune_finished_jobs():
+    """Forget jobs that finished more than PROGRESS_TIMEOUT seconds ago unread."""
+    cutoff = time.time() - PROGRESS_TIMEOUT
+    for job_id, finished_at in list(FINISHED_JOBS.items()):
+        if finished_at < cutoff:
+            forget_job(job_id)
+
+
+def sweep_stale_jobs():
+    """Remove job directories that have not been modified for JOB_MAX_AGE seconds."""
+    prune_finished_jobs()
+    
+    cutoff = time.time() - JOB_MAX_AGE
+    for path in Path(app.config['UPLOAD_FOLDER']).glob('pdf_gen_*'):
+        try:
+            if path.is_dir() and path.stat().st_mtime < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+def run_pdf_job(job_id: str, image_paths: List[Path], output_pdf: Path, page_size, download_url: str):
+    """Build the PDF for a job in the background, reporting progress to its queue."""
+    progress_queue = JOBS[job_id]
+    
+    def report_progress(done: int, total: int):
+        progress_queue.put({'stage': f'image {done}/{total}', 'pct': done * 100 // total})
+    
+    try:
+        create_pdf_with_images(image_paths, output_pdf, page_size, progress_cb=report_progress)
+    except Exception as e:
+        app.logger.error(f"Error generating PDF for job {job_id}: {e}")
+        progress_queue.put({'stage': 'error', 'error': str(e)})
+        shutil.rmtree(output_pdf.parent, ignore_errors=True)
+    else:
+        progress_queue.put({'stage': 'done', 'pct': 100, 'download_url': download_url})
+    finally:
+        # Keep the final message around briefly for a client still to connect
+        if job_id in JOBS:
+            FINISHED_JOBS[job_id] = time.time()
+        prune_finished_jobs()
+
+
 @app.route('/generate-pdf', methods=['POST'])
 def generate_pdf():
-    """Handle PDF generation from uploaded images."""
+    """Accept uploaded images and start a background PDF job."""
+    temp_path = None
+    job_started = False
     try:
-        # Check if files were uploaded
-        if 'images' not in request.files:
-            return jsonify({'error': 'No images uploaded'}), 400
+        # Jobs served by the proxy or never downloaded are removed here
+        sweep_stale_jobs()
         
-        files = request.files.getlist('images')
+        # Create working directory for this job
+        job_id = uuid.uuid4().hex
+        temp_path = job_dir(job_id)
+        temp_path.mkdir()
         
-        if not files or all(f.filename == '' for f in files):
-            return jsonify({'error': 'No images selected'}), 400
-        
-        # Get form data
-        priority_str = request.form.get('priority', '')
-        page_size_str = request.form.get('page_size', 'letter')
-        
-        # Create temporary directory for this request
-        temp_dir = tempfile.mkdtemp(prefix='pdf_gen_')
-        temp_path = Path(temp_dir)
+        # Stream the multipart body straight to disk instead of letting
+        # werkzeug parse request.files into memory first
+        images_target = ImageDirectoryTarget(temp_path)
+        priority_target = ValueTarget()
+        page_size_target = ValueTarget()
         
         try:
-            # Save uploaded files
-            image_paths = []
-            for file in files:
-                if file and allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    file_path = temp_path / filename
-                    file.save(str(file_path))
-                    image_paths.append(file_path)
-            
-            if not image_paths:
-                return jsonify({'error': 'No valid image files uploaded'}), 400
-            
-            # Parse priority list
-            priority_list = parse_priority_list(priority_str)
-            
-            # Set page size
-            page_size = A4 if page_size_str == 'A4' else letter
-            
-            # Split into groups
-            group1, group2 = split_by_semicolon(image_paths)
-            
-            # Sort each group
-            sorted_group1 = sort_by_priority(group1, priority_list)
-            sorted_group2 = sort_by_priority(group2, priority_list)
-            
-            # Combine groups
-            final_order = sorted_group1 + sorted_group2
-            
-            # Generate PDF
-            output_pdf = temp_path / 'output.pdf'
-            create_pdf_with_images(final_order, output_pdf, page_size)
-            
-            # Send the PDF file
-            return send_file(
-                str(output_pdf),
-                mimetype='application/pdf',
-                as_attachment=True,
-                download_name='generated.pdf'
-            )
+            parser = StreamingFormDataParser(headers=request.headers)
+            parser.register('images', images_target)
+            parser.register('priority', priority_target)
+            parser.register('page_size', page_size_target)
             
+            while chunk := request.stream.read(UPLOAD_CHUNK_SIZE):
+                parser.data_received(chunk)
+        except ParseFailedException as e:
+            return jsonify({'error': f'Invalid upload: {e}'}), 400
         finally:
-            # Clean up will happen after send_file completes
-            # We can't delete immediately as send_file needs the file
-            pass
+            # A part cut off mid-stream never gets on_finish
+            upload_truncated = images_target.close()
+        
+        if upload_truncated:
+            return jsonify({'error': 'Upload ended in the middle of a file'}), 400
+        
+        image_paths = images_target.paths
+        if not image_paths:
+            return jsonify({'error': 'No valid image files uploaded'}), 400
+        
+        # Get form data
+        priority_str = priority_target.value.decode('utf-8', 'replace')
+        page_size_str = page_size_target.value.decode('utf-8', 'replace') or 'letter'
+        
+        # Parse priority list
+        priority_list = parse_priority_list(priority_str)
+        
+        # Set page size
+        page_size = A4 if page_size_str == 'A4' else letter
+        
+        # Split into groups
+        group1, group2 = split_by_semicolon(image_paths)
+        
+        # Sort each group
+        sorted_group1 = sort_by_priority(group1, priority_list)
+        sorted_group2 = sort_by_priority(group2, priority_list)
+        
+        # Combine groups
+        final_order = sorted_group1 + sorted_group2
+        
+        # Generate PDF in the background; progress is streamed via /progress
+        output_pdf = temp_path / 'output.pdf'
+        download_url = url_for('download_pdf', job_id=job_id)
+        JOBS[job_id] = queue.Queue()
+        JOBS[job_id].put({'stage': 'queued', 'pct': 0})
+        PDF_BUILDS.submit(run_pdf_job, job_id, final_order, output_pdf, page_size, download_url)
+        job_started = True
+        
+        return jsonify({'job_id': job_id}), 202
             
     except Exception as e:
         app.logger.error(f"Error generating PDF: {e}")
         return jsonify({'error': str(e)}), 500
+    
+    finally:
+        # Rejected uploads never reach /download, so clean them up here
+        if temp_path is not None and not job_started:
+            shutil.rmtree(temp_path, ignore_errors=True)
+
+
+@app.route('/progress/<job_id>')
+def progress(job_id):
+    """Stream progress of a PDF job as Server-Sent Events."""
+    progress_queue = JOBS.get(job_id)
+    if progress_queue is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    
+    def generate():
+        idle = 0
+        queued = False
+        try:
+            while True:
+                try:
+                    msg = progress_queue.get(timeout=HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    idle += HEARTBEAT_INTERVAL
+                    # Waiting behind other builds is not a stall
+                    if idle >= PROGRESS_TIMEOUT and not queued:
+                        yield f"data: {json.dumps({'stage': 'error', 'error': 'Timed out waiting for progress'})}\n\n"
+                        return
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": heartbeat\n\n"
+                    continue
+                
+                idle = 0
+                queued = msg['stage'] == 'queued'
+                yield f"data: {json.dumps(msg)}\n\n"
+                if msg['stage'] in ('done', 'error'):
+                    return
+        finally:
+            # Finished, timed out or disconnected: nobody reads this queue again
+            forget_job(job_id)
+    
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/download/<job_id>')
+def download_pdf(job_id):
+    """Send the PDF produced by a finished job."""
+    temp_path = job_dir(job_id)
+    if temp_path is None or not (temp_path / 'output.pdf').is_file():
+        return jsonify({'error': 'PDF not found'}), 404
+    
+    # The proxy reads the file after this response is returned, so its job
+    # directory is left for sweep_stale_jobs instead of removed right away
+    accel_prefix = app.config['X_ACCEL_REDIRECT_PREFIX']
+    if accel_prefix:
+        return Response(headers={
+            'X-Accel-Redirect': f"{accel_prefix.rstrip('/')}/{temp_path.name}/output.pdf",
+            'Content-Type': 'application/pdf',
+            'Content-Disposition': 'attachment; filename=generated.pdf'
+        })
+    
+    if not app.config['USE_X_SENDFILE']:
+        @after_this_request
+        def cleanup(response):
+            # send_file has already opened the PDF, so the open handle keeps
+            # streaming after the directory is unlinked
+            shutil.rmtree(temp_path, ignore_errors=True)
+            return response
+    
+    return send_file(
+        str(temp_path / 'output.pdf'),
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name='generated.pdf'
+    )
 
 
 @app.route('/health')
@@ -0,0 +1,19 @@
+#!/usr/bin/env bash
+# Render build step: install requirements, then optionally swap Pillow for
+# Pillow-SIMD. Set PILLOW_SIMD=1 to enable the swap; it needs a C compiler
+# plus the libjpeg-turbo and zlib headers, which the build image must provide.
+set -euo pipefail
+
+pip install -r requirements.txt
+
+if [ "${PILLOW_SIMD:-0}" = "1" ]; then
+    # Build the wheel first so a failed compile leaves plain Pillow installed
+    if CC="cc -mavx2" pip wheel --no-deps --no-binary :all: -w /tmp/pillow-simd Pillow-SIMD==10.4.0.post0; then
+        pip uninstall -y pillow
+        pip install --no-deps /tmp/pillow-simd/*.whl
+    else
+        echo "Pillow-SIMD build failed; keeping Pillow" >&2
+    fi
+fi
+
+python -c "import PIL; print('PIL', PIL.__version__)"
@@ -4,15 +4,39 @@ Extracted from the CLI script for reuse in the web app.
 """
 
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, Iterator, List, Optional, Tuple, Union
 from PIL import Image
-from reportlab.lib.pagesizes import letter
+from reportlab.lib.pagesizes import letter, A4
 from reportlab.pdfgen import canvas
 from reportlab.lib.utils import ImageReader
-import sys
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
+import ahocorasick
+import logging
+import os
 import tempfile
 import io
 
+log = logging.getLogger(__name__)
+
+# Optional GPU acceleration; the CPU path is used when these are missing
+try:
+    import torch
+    import torchvision
+    from torchvision.transforms.v2.functional import resize
+except ImportError:
+    torch = None
+
+# JPEG settings for re-encoded images. optimize=True adds a second Huffman
+# pass that roughly doubles encode time for a few percent smaller output.
+JPEG_QUALITY = 88
+JPEG_OPTIMIZE = False
+
+# Number of JPEGs decoded together per nvJPEG batch
+CUDA_BATCH_SIZE = 16
+
 
 def split_by_semicolon(image_files: List[Path]) -> Tuple[List[Path], List[Path]]:
     """
@@ -30,6 +54,23 @@ def split_by_semicolon(image_files: List[Path]) -> Tuple[List[Path], List[Path]]
     return group1, group2
 
 
+@lru_cache(maxsize=32)
+def _priority_automaton(priority_items: Tuple[str, ...]) -> ahocorasick.Automaton:
+    """
+    Build an Aho-Corasick automaton over the priority keywords.
+    
+    Each keyword maps to the index of its first occurrence in the list, so a
+    single pass over a filename yields every matching keyword's priority.
+    Cached so the groups of one request share the same automaton.
+    """
+    automaton = ahocorasick.Automaton()
+    for idx, priority_item in enumerate(priority_items):
+        if priority_item not in automaton:
+            automaton.add_word(priority_item, idx)
+    automaton.make_automaton()
+    return automaton
+
+
 def sort_by_priority(files: List[Path], priority_list: List[str]) -> List[Path]:
     """
     Sort files based on priority list.
@@ -44,127 +85,368 @@ def sort_by_priority(files: List[Path], priority_list: List[str]) -> List[Path]:
     Returns:
         Sorted list of file paths
     """
-    def get_priority_index(file_path: Path) -> int:
+    if not priority_list:
+        return list(files)
+    
+    automaton = _priority_automaton(tuple(priority_list))
+    
+    # Original positions, so unmatched files keep their relative order
+    positions = {id(file_path): idx for idx, file_path in enumerate(files)}
+    
+    def get_priority_key(file_path: Path) -> Tuple[int, int]:
         """
-        Get the priority index for a file.
-        Returns the index of the first matching priority keyword,
-        or a large number if no match found.
+        Get the sort key for a file.
+        Returns (0, index of the first matching priority keyword),
+        or (1, original position) if no match found.
         """
-        filename = file_path.name
+        # Keywords contained in the filename, found in one scan
+        best = min((idx for _, idx in automaton.iter(file_path.name)), default=None)
+        if best is not None:
+            return (0, best)
+        
+        return (1, positions[id(file_path)])
+    
+    return sorted(files, key=get_priority_key)
+
+
+def _available_area(page_size) -> Tuple[float, float]:
+    """Return the (width, height) in points left for an image on a page."""
+    page_width, page_height = page_size
+    
+    # Leave room for heading and margins
+    available_width = page_width - 100  # 50pt margins on each side
+    available_height = page_height - 150  # Top margin (including heading) + bottom margin
+    return available_width, available_height
+
+
+# Image areas for the page sizes offered by the web app
+_AVAILABLE_AREAS = {size: _available_area(size) for size in (letter, A4)}
+
+
+def _fit_to_page(img_width: int, img_height: int, available) -> Tuple[float, float, int, int]:
+    """
+    Work out how large an image is drawn on the page and how many pixels it needs.
+    
+    Args:
+        img_width: Source image width in pixels
+        img_height: Source image height in pixels
+        available: (width, height) in points left for the image, from _available_area
+        
+    Returns:
+        Tuple of (scaled_width, scaled_height, target_pixel_width, target_pixel_height)
+    """
+    available_width, available_height = available
+    
+    # Calculate scaling to fit image on page while maintaining aspect ratio
+    width_ratio = available_width / img_width
+    height_ratio = available_height / img_height
+    scale_ratio = min(width_ratio, height_ratio, 1.0)  # Don't upscale
+    
+    scaled_width = img_width * scale_ratio
+    scaled_height = img_height * scale_ratio
+    
+    # Resize image to target dimensions to reduce file size
+    # Convert points to pixels at 72 DPI
+    target_pixel_width = int(scaled_width * 2)  # Back to 2x for better quality
+    target_pixel_height = int(scaled_height * 2)
+    
+    return scaled_width, scaled_height, target_pixel_width, target_pixel_height
+
+
+def _prep(img_path: Path, available) -> Tuple[bytes, float, float, str]:
+    """
+    Load, flatten, resize and JPEG-encode one image for placement on a page.
+    
+    JPEGs that are already RGB and small enough are passed through unchanged.
+    
+    Runs on worker threads; Pillow releases the GIL inside its codecs and
+    resampling code, so images are prepared in parallel.
+    
+    Args:
+        img_path: Image file to prepare
+        available: (width, height) in points left for the image on the page
+        
+    Returns:
+        Tuple of (jpeg_bytes, scaled_width, scaled_height, display_name)
+    """
+    # Replace underscores with spaces for display
+    display_name = img_path.stem.replace('_', ' ')
+    
+    # Open lazily; only the header is read until pixels are needed
+    with Image.open(img_path) as img:
+        img_width, img_height = img.size
+        
+        scaled_width, scaled_height, target_pixel_width, target_pixel_height = \
+            _fit_to_page(img_width, img_height, available)
+        needs_resize = img_width > target_pixel_width or img_height > target_pixel_height
+        
+        # RGB JPEGs that already fit are embedded as-is, skipping the
+        # decode/re-encode round-trip entirely
+        if img.format == 'JPEG' and img.mode == 'RGB' and not needs_resize:
+            return img_path.read_bytes(), scaled_width, scaled_height, display_name
+        
+        # Let libjpeg decode oversized JPEGs at a reduced DCT scale (1/2, 1/4
+        # or 1/8) that is still at least the target size; no-op for other formats
+        if needs_resize:
+            img.draft('RGB', (target_pixel_width, target_pixel_height))
+        
+        # Convert to RGB if necessary (for PNG with transparency)
+        if img.mode == 'P':
+            img = img.convert('RGBA') if 'transparency' in img.info else img.convert('RGB')
+        if img.mode in ('RGBA', 'LA'):
+            alpha = img.getchannel('A')
+            if alpha.getextrema() == (255, 255):
+                # Fully opaque - no need to composite onto white
+                img = img.convert('RGB')
+            else:
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=alpha)
+                img = background
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+        
+        if needs_resize:
+            img = img.resize((target_pixel_width, target_pixel_height), Image.LANCZOS)
+        
+        # Encode as baseline JPEG with 4:2:0 chroma subsampling
+        img_buffer = io.BytesIO()
+        img.save(img_buffer, format='JPEG', quality=JPEG_QUALITY, subsampling=2,
+                 progressive=False, optimize=JPEG_OPTIMIZE)
+    
+    return img_buffer.getvalue(), scaled_width, scaled_height, display_name
+
+
+@lru_cache(maxsize=None)
+def _cuda_available() -> bool:
+    """Check once whether torchvision can decode JPEGs on a CUDA device."""
+    return torch is not None and torch.cuda.is_available()
+
+
+def _gpu_layout(img_path: Path, available) -> Optional[Tuple[float, float, int, int]]:
+    """
+    Return the _fit_to_page layout of an image if it should be prepared on the GPU.
+    
+    Only JPEGs that need downscaling qualify; everything else, including files
+    that cannot be read, returns None and is left to the CPU path.
+    """
+    try:
+        with Image.open(img_path) as img:
+            img_width, img_height = img.size
+            img_format = img.format
+    except Exception:
+        return None
+    
+    layout = _fit_to_page(img_width, img_height, available)
+    _, _, target_pixel_width, target_pixel_height = layout
+    if img_format == 'JPEG' and (img_width > target_pixel_width or img_height > target_pixel_height):
+        return layout
+    return None
+
+
+def _prep_batch_cuda(executor: ThreadPoolExecutor, img_paths: List[Path],
+                     layouts: List[Tuple[float, float, int, int]],
+                     available) -> List[Union[Tuple[bytes, float, float, str], Future]]:
+    """
+    Decode, resize and re-encode a batch of oversized JPEGs on the GPU.
+    
+    If the GPU rejects the batch (e.g. a CMYK JPEG or out of memory), each
+    image is submitted to the executor for the CPU path in _prep instead.
+    
+    Args:
+        executor: Pool that CPU fallbacks are submitted to
+        img_paths: Oversized JPEG files to prepare
+        layouts: _fit_to_page layout of each image
+        available: (width, height) in points left for each image on the page
         
-        for idx, priority_item in enumerate(priority_list):
-            # Check if priority item matches the filename or is contained in it
-            if priority_item == filename or priority_item in filename:
-                return idx
+    Returns:
+        One entry per image: the _prep result tuple, or the Future of its
+        CPU fallback
+    """
+    try:
+        data = [torchvision.io.read_file(str(img_path)) for img_path in img_paths]
+        decoded = torchvision.io.decode_jpeg(data, mode=torchvision.io.ImageReadMode.RGB, device='cuda')
+        resized = [
+            resize(img, [target_pixel_height, target_pixel_width], antialias=True).cpu()
+            for img, (_, _, target_pixel_width, target_pixel_height) in zip(decoded, layouts)
+        ]
+        encoded = torchvision.io.encode_jpeg(resized, quality=JPEG_QUALITY)
+    except Exception as e:
+        log.warning("GPU batch failed, using CPU: %s", e)
+        return [executor.submit(_prep, img_path, available) for img_path in img_paths]
+    
+    return [
+        (jpeg.numpy().tobytes(), scaled_width, scaled_height, img_path.stem.replace('_', ' '))
+        for jpeg, img_path, (scaled_width, scaled_height, _, _) in zip(encoded, img_paths, layouts)
+    ]
+
+
+class _BatchItem:
+    """Future-like view of one image's outcome within a batch future."""
+    
+    def __init__(self, batch_future: Future, index: int):
+        self.batch_future = batch_future
+        self.index = index
+    
+    def result(self) -> Tuple[bytes, float, float, str]:
+        outcome = self.batch_future.result()[self.index]
+        if isinstance(outcome, Future):
+            return outcome.result()
+        return outcome
+
+
+def _submit_chunk(executor: ThreadPoolExecutor, chunk: List[Path], available) -> list:
+    """
+    Submit preparation of a chunk of images, returning (img_path, future) pairs.
+    
+    With CUDA available, the chunk's oversized JPEGs go to the GPU as one
+    batch; every other image is still submitted to the pool on its own.
+    """
+    if not _cuda_available():
+        return [(img_path, executor.submit(_prep, img_path, available)) for img_path in chunk]
+    
+    layouts = [_gpu_layout(img_path, available) for img_path in chunk]
+    gpu_indices = [i for i, layout in enumerate(layouts) if layout is not None]
+    
+    futures = {}
+    if gpu_indices:
+        batch_future = executor.submit(
+            _prep_batch_cuda, executor,
+            [chunk[i] for i in gpu_indices], [layouts[i] for i in gpu_indices], available
+        )
+        for position, i in enumerate(gpu_indices):
+            futures[i] = _BatchItem(batch_future, position)
+    
+    for i, img_path in enumerate(chunk):
+        if i not in futures:
+            futures[i] = executor.submit(_prep, img_path, available)
+    
+    return [(img_path, futures[i]) for i, img_path in enumerate(chunk)]
+
+
+def _prepare_in_order(executor: ThreadPoolExecutor, image_files: List[Path], available,
+                      window: int) -> Iterator[Tuple[Path, Future]]:
+    """
+    Yield (img_path, future) pairs in order, submitting work only `window`
+    images ahead of the consumer.
+    
+    Prepared JPEG bytes are released as soon as the consumer moves on,
+    instead of every result staying alive until the whole PDF is drawn.
+    """
+    chunk_size = CUDA_BATCH_SIZE if _cuda_available() else 1
+    upcoming = iter(image_files)
+    pending = deque()
+    while True:
+        while len(pending) < window:
+            chunk = list(islice(upcoming, chunk_size))
+            if not chunk:
+                break
+            pending.extend(_submit_chunk(executor, chunk, available))
+        if not pending:
+            return
+        yield pending.popleft()
+
+
+def _make_drawer(page_size) -> Callable[[canvas.Canvas, bytes, str, float, float], None]:
+    """
+    Build a page-drawing function with the layout for one page size baked in.
+    
+    The heading and image positions only depend on the page size, so they
+    are computed once here instead of for every page.
+    
+    Args:
+        page_size: PDF page size the drawer lays out pages for
         
-        # No match found - assign large index to maintain relative order
-        return len(priority_list) + files.index(file_path)
+    Returns:
+        Function drawing one image page as (canvas, jpeg_bytes, display_name,
+        scaled_width, scaled_height) and starting the next page
+    """
+    page_width, page_height = page_size
+    rect_x = 40
+    rect_y = page_height - 65
+    rect_width = page_width - 80
+    rect_height = 35
+    text_x = 50
+    text_y = page_height - 50
+    image_top = page_height - 100
+    
+    def draw_page(c: canvas.Canvas, img_bytes: bytes, display_name: str,
+                  scaled_width: float, scaled_height: float):
+        # Draw black background rectangle for heading; every page
+        # starts with a black fill, so no setFillColorRGB is needed
+        c.rect(rect_x, rect_y, rect_width, rect_height, fill=1, stroke=0)
+        
+        # Add filename as heading at the top (without extension) in yellow;
+        # showPage resets the font, so it is set again on every page
+        c.setFillColorRGB(1, 1, 0)  # Yellow text
+        c.setFont("Helvetica-Bold", 16)
+        c.drawString(text_x, text_y, display_name)
+        
+        # Center the image horizontally on the page
+        img_x = (page_width - scaled_width) / 2
+        # Position image below the heading
+        img_y = image_top - scaled_height
+        
+        # Draw the compressed image using ImageReader
+        img_reader = ImageReader(io.BytesIO(img_bytes))
+        # Size is already fitted, so ReportLab need not re-fit it
+        c.drawImage(img_reader, img_x, img_y, 
+                   width=scaled_width, height=scaled_height)
+        
+        # Start new page for next image
+        c.showPage()
     
-    return sorted(files, key=get_priority_index)
+    return draw_page
+
+
+# Drawers for the page sizes offered by the web app
+_DRAWERS = {size: _make_drawer(size) for size in (letter, A4)}
 
 
 def create_pdf_with_images(image_files: List[Path], output_path: Path, 
-                           page_size=letter):
+                           page_size=letter,
+                           progress_cb: Optional[Callable[[int, int], None]] = None):
     """
     Create a PDF with each image on its own page and filename as heading.
     
+    Images are decoded, resized and encoded on a thread pool (in GPU batches
+    when CUDA is available), a bounded number ahead of the page being drawn;
+    only the ReportLab drawing, which is not thread-safe, happens on this thread.
+    
     Args:
         image_files: Ordered list of image files to include
         output_path: Path where the PDF should be saved
         page_size: PDF page size (default: letter)
+        progress_cb: Optional callback invoked as (done, total) after each image
     """
     if not image_files:
-        print("Warning: No images to process")
+        log.warning("No images to process")
         return
     
     c = canvas.Canvas(str(output_path), pagesize=page_size)
-    page_width, page_height = page_size
+    draw_page = _DRAWERS.get(tuple(page_size)) or _make_drawer(page_size)
+    available = _AVAILABLE_AREAS.get(tuple(page_size)) or _available_area(page_size)
     
-    for img_path in image_files:
-        try:
-            # Draw black background rectangle for heading
-            c.setFillColorRGB(0, 0, 0)  # Black background
-            rect_x = 40
-            rect_y = page_height - 65
-            rect_width = page_width - 80
-            rect_height = 35
-            c.rect(rect_x, rect_y, rect_width, rect_height, fill=1, stroke=0)
-            
-            # Add filename as heading at the top (without extension) in yellow
-            c.setFillColorRGB(1, 1, 0)  # Yellow text
-            c.setFont("Helvetica-Bold", 16)
-            text_x = 50
-            text_y = page_height - 50
-            # Replace underscores with spaces for display
-            display_name = img_path.stem.replace('_', ' ')
-            c.drawString(text_x, text_y, display_name)
-            
-            # Reset fill color to black for image drawing
-            c.setFillColorRGB(0, 0, 0)
-            
-            # Load image and get dimensions
-            img = Image.open(img_path)
-            
-            # Convert to RGB if necessary (for PNG with transparency)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            img_width, img_height = img.size
-            
-            # Calculate available space (leaving room for heading and margins)
-            available_width = page_width - 100  # 50pt margins on each side
-            available_height = page_height - 150  # Top margin (including heading) + bottom margin
-            
-            # Calculate scaling to fit image on page while maintaining aspect ratio
-            width_ratio = available_width / img_width
-            height_ratio = available_height / img_height
-            scale_ratio = min(width_ratio, height_ratio, 1.0)  # Don't upscale
-            
-            scaled_width = img_width * scale_ratio
-            scaled_height = img_height * scale_ratio
-            
-            # Resize image to target dimensions to reduce file size
-            # Convert points to pixels at 72 DPI
-            target_pixel_width = int(scaled_width * 2)  # Back to 2x for better quality
-            target_pixel_height = int(scaled_height * 2)
-            
-            if img_width > target_pixel_width or img_height > target_pixel_height:
-                img = img.resize((target_pixel_width, target_pixel_height), Image.LANCZOS)
-            
-            # Save to temporary JPEG with higher quality for better clarity
-            img_buffer = io.BytesIO()
-            img.save(img_buffer, format='JPEG', quality=92, optimize=True)
-            img_buffer.seek(0)
-            
-            # Center the image horizontally on the page
-            img_x = (page_width - scaled_width) / 2
-            # Position image below the heading
-            img_y = page_height - 100 - scaled_height
-            
-            # Draw the compressed image using ImageReader
-            img_reader = ImageReader(img_buffer)
-            c.drawImage(img_reader, img_x, img_y, 
-                       width=scaled_width, height=scaled_height,
-                       preserveAspectRatio=True)
-            
-            # Start new page for next image
-            c.showPage()
-            
-            print(f"Added: {img_path.name}")
+    total = len(image_files)
+    max_workers = os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        prepared = _prepare_in_order(executor, image_files, available, window=2 * max_workers)
+        for done, (img_path, future) in enumerate(prepared, 1):
+            try:
+                img_bytes, scaled_width, scaled_height, display_name = future.result()
+                
+                draw_page(c, img_bytes, display_name, scaled_width, scaled_height)
+                
+                log.debug("Added: %s", img_path.name)
+                
+            except Exception:
+                log.exception("Error processing %s", img_path.name)
             
-        except Exception as e:
-            print(f"Error processing {img_path.name}: {e}", file=sys.stderr)
-            continue
+            if progress_cb:
+                progress_cb(done, total)
     
     # Save the PDF
     c.save()
-    print(f"\nPDF created successfully: {output_path}")
+    log.info("PDF created successfully: %s", output_path)
 
 
 def parse_priority_list(priority_str: str) -> List[str]: